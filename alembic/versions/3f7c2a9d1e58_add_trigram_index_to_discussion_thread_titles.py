@@ -0,0 +1,43 @@
+"""Add trigram index to discussion thread titles
+
+Revision ID: 3f7c2a9d1e58
+Revises: d5fd17ab9677
+Create Date: 2026-10-15 10:12:41.382907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f7c2a9d1e58'
+down_revision: Union[str, Sequence[str], None] = 'd5fd17ab9677'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_discussion_threads_title_trgm',
+            'discussion_threads',
+            ['title'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'title': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_discussion_threads_title_trgm',
+            table_name='discussion_threads',
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,53 @@
+"""Add user_id, id index to discussion threads
+
+Revision ID: 8b41e6c0d2a7
+Revises: 3f7c2a9d1e58
+Create Date: 2026-10-15 11:03:27.519044
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b41e6c0d2a7'
+down_revision: Union[str, Sequence[str], None] = '3f7c2a9d1e58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_discussion_threads_user_id_id_desc',
+            'discussion_threads',
+            ['user_id', sa.text('id DESC')],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        # The composite index's leading column serves plain user_id lookups
+        op.drop_index(
+            'ix_discussion_threads_user_id',
+            table_name='discussion_threads',
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_discussion_threads_user_id',
+            'discussion_threads',
+            ['user_id'],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            'ix_discussion_threads_user_id_id_desc',
+            table_name='discussion_threads',
+            postgresql_concurrently=True,
+        )
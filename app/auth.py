@@ -1,22 +1,42 @@
+from app.config import get_settings
 from app.db import get_async_session
 from app.models import User
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from collections import OrderedDict
 from datetime import datetime, timedelta, UTC
-from dotenv import dotenv_values
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+import hashlib
 import jwt
 from jwt.exceptions import InvalidTokenError
 from passlib.hash import pbkdf2_sha256
 from pydantic import BaseModel
+from sqlalchemy import bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
+from threading import Lock
 from typing import Annotated
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-config = dotenv_values(".env")
+config = get_settings()
 SECRET_KEY = config.get("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 1.0
+PASSWORD_VERIFY_CACHE = config.get("PASSWORD_VERIFY_CACHE", "0") == "1"
+PASSWORD_VERIFY_CACHE_SIZE = 4096
+PBKDF2_SHA256_HASH_PREFIX = "$pbkdf2-sha256$"
+
+select_user_by_username = select(User).where(
+    User.username == bindparam("username")
+)
+password_hasher = PasswordHasher(time_cost=2, memory_cost=65536, parallelism=1)
+
+# Keyed by (stored hash, sha256 of the password) so plaintext is never kept in
+# memory and a password change naturally misses the cache.
+verified_passwords: OrderedDict[tuple[str, bytes], None] = OrderedDict()
+# verify_password runs in worker threads, so cache access must be serialized.
+verified_passwords_lock = Lock()
 
 class Token(BaseModel):
     access_token: str
@@ -26,10 +46,32 @@ class TokenData(BaseModel):
     username: str | None = None
 
 def hash_password(password) -> str:
-    return pbkdf2_sha256.hash(password)
+    return password_hasher.hash(password)
+
+def check_password_hash(password, hash) -> bool:
+    # Users created before the switch to argon2 still have pbkdf2_sha256 hashes
+    if hash.startswith(PBKDF2_SHA256_HASH_PREFIX):
+        return pbkdf2_sha256.verify(password, hash)
+    try:
+        return password_hasher.verify(hash, password)
+    except (InvalidHashError, VerificationError):
+        return False
 
 def verify_password(password, hash) -> bool:
-    return pbkdf2_sha256.verify(password, hash)
+    if not PASSWORD_VERIFY_CACHE:
+        return check_password_hash(password, hash)
+    key = (hash, hashlib.sha256(password.encode()).digest())
+    with verified_passwords_lock:
+        if key in verified_passwords:
+            verified_passwords.move_to_end(key)
+            return True
+    is_password_verified = check_password_hash(password, hash)
+    if is_password_verified:
+        with verified_passwords_lock:
+            verified_passwords[key] = None
+            if len(verified_passwords) > PASSWORD_VERIFY_CACHE_SIZE:
+                verified_passwords.popitem(last=False)
+    return is_password_verified
 
 def create_access_token(data: dict, expires_delta: timedelta):
     to_encode = data.copy()
@@ -55,8 +97,9 @@ async def get_current_user(
         token_data = TokenData(username=username)
     except InvalidTokenError:
         raise credentials_exception
-    statement = select(User).where(User.username == token_data.username)
-    results = await session.execute(statement)
+    results = await session.execute(
+        select_user_by_username, {"username": token_data.username}
+    )
     user = results.scalar()
     if user is None:
         raise credentials_exception
@@ -0,0 +1,69 @@
+from app.config import get_settings
+
+from fastapi.encoders import jsonable_encoder
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+config = get_settings()
+REDIS_URL = config.get("REDIS_URL")
+LIST_CACHE_TTL = int(config.get("LIST_CACHE_TTL") or 30)
+LIST_CACHE_PREFIX = "dt:list"
+# Bumping the version orphans every cached page at once; the old keys simply
+# expire after LIST_CACHE_TTL instead of being scanned and deleted.
+LIST_CACHE_VERSION_KEY = f"{LIST_CACHE_PREFIX}:version"
+
+redis_client = Redis.from_url(REDIS_URL, decode_responses=True) if REDIS_URL else None
+
+
+async def close_cache():
+    if redis_client is not None:
+        await redis_client.aclose()
+
+
+async def list_cache_key(
+    user_id, search_title: str | None, cursor: int | None, limit: int
+) -> str | None:
+    if redis_client is None:
+        return None
+    try:
+        version = await redis_client.get(LIST_CACHE_VERSION_KEY) or 0
+    except RedisError:
+        return None
+    return "{}:{}:{}:{}:{}:{}".format(
+        LIST_CACHE_PREFIX,
+        version,
+        user_id or "any",
+        search_title or "",
+        "" if cursor is None else cursor,
+        limit,
+    )
+
+
+async def get_cached_list(key: str | None) -> str | None:
+    if redis_client is None or key is None:
+        return None
+    try:
+        return await redis_client.get(key)
+    except RedisError:
+        return None
+
+
+async def set_cached_list(key: str | None, page: dict):
+    if redis_client is None or key is None:
+        return
+    try:
+        await redis_client.set(
+            key, orjson.dumps(jsonable_encoder(page)), ex=LIST_CACHE_TTL
+        )
+    except RedisError:
+        pass
+
+
+async def invalidate_cached_lists():
+    if redis_client is None:
+        return
+    try:
+        await redis_client.incr(LIST_CACHE_VERSION_KEY)
+    except RedisError:
+        pass
@@ -0,0 +1,7 @@
+from dotenv import dotenv_values
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> dict[str, str | None]:
+    return dotenv_values(".env")
@@ -1,9 +1,12 @@
-from dotenv import dotenv_values
+from app.config import get_settings
+
+import logging
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-config = dotenv_values(".env")
+config = get_settings()
 DATABASE_URL = "postgresql+asyncpg://{}:{}@{}:{}/{}".format(
     config.get("DB_USER"),
     config.get("DB_PASSWORD"),
@@ -11,8 +14,42 @@ DATABASE_URL = "postgresql+asyncpg://{}:{}@{}:{}/{}".format(
     config.get("DB_PORT"),
     config.get("DB_NAME"),
 )
+SQL_ECHO = config.get("SQL_ECHO", "0") == "1"
+DB_POOL_SIZE = int(config.get("DB_POOL_SIZE") or 20)
+DB_MAX_OVERFLOW = int(config.get("DB_MAX_OVERFLOW") or 20)
+DB_POOL_RECYCLE = int(config.get("DB_POOL_RECYCLE") or 1800)
+DEPLOY_MODE = config.get("DEPLOY_MODE") or "server"
+# Behind PgBouncer in transaction pooling mode, prepared statements do not
+# survive between transactions; set DB_STATEMENT_CACHE_SIZE=0 there.
+DB_STATEMENT_CACHE_SIZE = int(config.get("DB_STATEMENT_CACHE_SIZE") or 500)
+
+if not SQL_ECHO:
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
 
-async_engine = create_async_engine(DATABASE_URL, echo=True, pool_pre_ping=True)
+# Serverless instances are short-lived and scaled out, so a per-instance pool
+# only holds idle connections open; connect per checkout instead.
+if DEPLOY_MODE == "serverless":
+    pool_options = {"poolclass": NullPool}
+else:
+    pool_options = {
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": True,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+async_engine = create_async_engine(
+    DATABASE_URL,
+    echo=SQL_ECHO,
+    echo_pool=False,
+    query_cache_size=2048,
+    connect_args={
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    },
+    **pool_options,
+)
 async_session = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 
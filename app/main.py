@@ -3,36 +3,57 @@ from app.auth import (
     create_access_token,
     get_current_user,
     hash_password,
+    select_user_by_username,
     Token,
     verify_password,
 )
+from app.cache import (
+    close_cache,
+    get_cached_list,
+    list_cache_key,
+    set_cached_list,
+)
+from app.config import get_settings
 from app.db import (
     get_async_session,
     dispose_async_engine,
 )
 from app.models import DiscussionThread, User
+from app.responses import ORJSONResponse
+from app.storage import close_storage, open_storage
 from .routers import discussion_threads
 
+import asyncio
 from contextlib import asynccontextmanager
 from datetime import timedelta
-from dotenv import dotenv_values
-from fastapi import Depends, FastAPI, Form, HTTPException, Request, status
+from fastapi import (
+    Depends,
+    FastAPI,
+    Form,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    status,
+)
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlmodel import col, select
 import time
 from typing import Annotated
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await open_storage()
     yield
     await dispose_async_engine()
+    await close_cache()
+    await close_storage()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 app.include_router(discussion_threads.router)
 
 origins = ["http://localhost:5173"]
@@ -44,7 +65,7 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-config = dotenv_values(".env")
+config = get_settings()
 image_path = config.get("IMAGE_PATH") or "/static"
 app.mount(image_path, StaticFiles(directory="static/images"), name="discussion_thread_images")
 
@@ -67,13 +88,16 @@ async def login_for_access_token(
         detail="Incorrect username or password",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    statement = select(User).where(User.username == form_data.username)
-    results = await session.execute(statement)
+    results = await session.execute(
+        select_user_by_username, {"username": form_data.username}
+    )
     user = results.scalar()
     if user is None:
         raise credentials_exception
 
-    is_password_verified = verify_password(form_data.password, user.hashed_password)
+    is_password_verified = await asyncio.to_thread(
+        verify_password, form_data.password, user.hashed_password
+    )
     if not is_password_verified:
         raise credentials_exception
 
@@ -96,8 +120,9 @@ async def create_user(
             status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
             detail="Two passwords are not the same",
         )
+    hashed_password = await asyncio.to_thread(hash_password, password)
     try:
-        new_user = User(username=username, hashed_password=hash_password(password))
+        new_user = User(username=username, hashed_password=hashed_password)
         session.add(new_user)
         await session.commit()
         return {"message": "New user created"}
@@ -110,11 +135,22 @@ async def create_user(
 @app.get("/user/discussion_threads/")
 async def my_discussion_threads(
     current_user: Annotated[User, Depends(get_current_user)],
+    limit: Annotated[
+        int, Query(ge=1, le=discussion_threads.MAX_PAGE_SIZE)
+    ] = discussion_threads.DEFAULT_PAGE_SIZE,
+    cursor: int | None = None,
     session: AsyncSession = Depends(get_async_session),
 ):
-    statement = select(DiscussionThread, User) \
-        .where(DiscussionThread.user_id == User.id) \
-        .where(DiscussionThread.user_id == current_user.id) \
-        .order_by(col(DiscussionThread.created_at).desc())
+    cache_key = await list_cache_key(current_user.id, None, cursor, limit)
+    cached_page = await get_cached_list(cache_key)
+    if cached_page is not None:
+        return Response(content=cached_page, media_type="application/json")
+    statement = discussion_threads.select_discussion_thread_summaries() \
+        .where(DiscussionThread.user_id == current_user.id)
+    statement = discussion_threads.paginate_discussion_threads(
+        statement, limit, cursor
+    )
     results = await session.execute(statement)
-    return discussion_threads.format_discussion_threads(results)
+    page = discussion_threads.format_discussion_threads_page(results, limit)
+    await set_cached_list(cache_key, page)
+    return page
@@ -1,5 +1,5 @@
 from datetime import datetime, UTC
-from sqlalchemy import Integer, String, Text, Uuid
+from sqlalchemy import Index, Integer, String, Text, Uuid, text
 from sqlmodel import Column, DateTime, Field, ForeignKey, SQLModel
 import uuid
 
@@ -7,7 +7,7 @@ import uuid
 class User(SQLModel, table=True):
     __tablename__: str = "users"
 
-    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    id: uuid.UUID = Field(default_factory=uuid.uuid7, primary_key=True)
     username: str = Field(
         sa_column=Column(String(50), unique=True, index=True, nullable=False)
     )
@@ -20,10 +20,19 @@ class User(SQLModel, table=True):
 
 class DiscussionThread(SQLModel, table=True):
     __tablename__: str = "discussion_threads"
+    __table_args__ = (
+        Index(
+            "ix_discussion_threads_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+        Index("ix_discussion_threads_user_id_id_desc", "user_id", text("id DESC")),
+    )
 
     id: int | None = Field(default=None, sa_column=Column(Integer, primary_key=True))
     user_id: uuid.UUID = Field(
-        sa_column=Column(Uuid, ForeignKey("users.id"), index=True, nullable=False)
+        sa_column=Column(Uuid, ForeignKey("users.id"), nullable=False)
     )
     title: str = Field(sa_column=Column(String(200), index=True, nullable=False))
     content: str = Field(sa_column=Column(Text, nullable=False))
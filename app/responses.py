@@ -0,0 +1,8 @@
+from fastapi.responses import JSONResponse
+import orjson
+from typing import Any
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
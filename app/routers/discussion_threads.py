@@ -1,9 +1,19 @@
 from app.auth import get_current_user
+from app.cache import (
+    get_cached_list,
+    invalidate_cached_lists,
+    list_cache_key,
+    set_cached_list,
+)
+from app.config import get_settings
 from app.db import get_async_session
 from app.models import DiscussionThread, User
+from app import storage
 
+import anyio
+from botocore.exceptions import BotoCoreError, ClientError
 from datetime import datetime, UTC
-from dotenv import dotenv_values
+from email.utils import format_datetime
 from fastapi import (
     APIRouter,
     BackgroundTasks,
@@ -11,18 +21,27 @@ from fastapi import (
     Form,
     HTTPException,
     Query,
+    Request,
+    Response,
     status,
     UploadFile
 )
+from fastapi.responses import RedirectResponse
 import os
 import re
-import shutil
+from sqlalchemy import delete, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select, col
 from time import time
 from typing import Annotated, TypeGuard
 
 
+IMAGE_PATH = get_settings().get("IMAGE_PATH")
+IMAGE_CHUNK_SIZE = 1 << 20
+FILE_EXTENSION_REGEX = re.compile(r"\.[^.]+$")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
 router = APIRouter(
     prefix="/discussion_threads",
     tags=["discussion_threads"],
@@ -39,19 +58,50 @@ def transform_keys_camel_case(discussion_threads) -> list:
         })
     return lst
 
-def substitute_user_id_username(query_results) -> list:
-    lst = []
-    for (discussion_thread, user) in query_results:
-        discussion_thread_dict = vars(discussion_thread)
-        del discussion_thread_dict["user_id"]
-        del discussion_thread_dict["_sa_instance_state"]
-        discussion_thread_dict.update({"author": user.username})
-        lst.append(discussion_thread_dict)
-    return lst
+def select_discussion_thread_summaries():
+    return select(
+        col(DiscussionThread.id),
+        col(DiscussionThread.title),
+        col(DiscussionThread.created_at),
+        col(DiscussionThread.updated_at),
+        col(User.username).label("author"),
+    ).where(DiscussionThread.user_id == User.id)
 
 def format_discussion_threads(query_results) -> list:
-    substituted_list = substitute_user_id_username(query_results)
-    return transform_keys_camel_case(substituted_list)
+    return transform_keys_camel_case(row._mapping for row in query_results)
+
+def paginate_discussion_threads(statement, limit: int, cursor: int | None):
+    if cursor is not None:
+        statement = statement.where(col(DiscussionThread.id) < cursor)
+    return statement.order_by(col(DiscussionThread.id).desc()).limit(limit)
+
+def format_discussion_threads_page(query_results, limit: int) -> dict:
+    items = format_discussion_threads(query_results)
+    next_cursor = items[-1]["id"] if len(items) == limit else None
+    return {"items": items, "nextCursor": next_cursor}
+
+def discussion_thread_cache_headers(discussion_thread: DiscussionThread) -> dict:
+    last_modified = discussion_thread.updated_at or discussion_thread.created_at
+    return {
+        "ETag": f'W/"{discussion_thread.id}-{last_modified.timestamp()}"',
+        "Last-Modified": format_datetime(last_modified.astimezone(UTC), usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+
+def strip_weak_etag(etag: str) -> str:
+    etag = etag.strip()
+    return etag[2:] if etag.startswith("W/") else etag
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match uses weak comparison, so W/ is ignored on both sides
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = strip_weak_etag(etag)
+    return any(
+        strip_weak_etag(tag) == opaque_tag for tag in if_none_match.split(",")
+    )
 
 def remove_image(image_path: str):
     relative_image_path = f".{image_path}"
@@ -66,7 +116,7 @@ def remove_image(image_path: str):
 def is_image(image: UploadFile | None) -> TypeGuard[UploadFile]:
     if image is None:
         return False
-    if image.content_type and re.match("image/.+", image.content_type) is None:
+    if image.content_type and not image.content_type.startswith("image/"):
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
             detail="Uploaded file is not an image"
@@ -74,23 +124,29 @@ def is_image(image: UploadFile | None) -> TypeGuard[UploadFile]:
     return True
 
 async def save_image(image: UploadFile, username: str, title: str) -> str:
-    file_extension_search = image.filename and re.search(r"\..+$", image.filename)
+    file_extension_search = image.filename and FILE_EXTENSION_REGEX.search(image.filename)
     if not file_extension_search:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
             detail="Uploaded file is not an image"
         )
-    config = dotenv_values(".env")
-    image_path = "{}/{}_{}_{}{}".format(
-        config.get("IMAGE_PATH"),
+    filename = "{}_{}_{}{}".format(
         int(time()),
         username,
         title,
         file_extension_search.group()
     )
+    if storage.s3_client is not None:
+        try:
+            return await storage.upload_image(image, filename)
+        except (BotoCoreError, ClientError) as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e))
+    image_path = f"{IMAGE_PATH}/{filename}"
     try:
-        with open(f".{image_path}", "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+        async with await anyio.open_file(f".{image_path}", "wb") as buffer:
+            while chunk := await image.read(IMAGE_CHUNK_SIZE):
+                await buffer.write(chunk)
             return image_path
     except IOError as e:
         raise HTTPException(
@@ -99,34 +155,44 @@ async def save_image(image: UploadFile, username: str, title: str) -> str:
 async def get_discussion_thread(
     discussion_thread_id: int, session: AsyncSession = Depends(get_async_session)
 ):
-    statement = select(DiscussionThread).where(
-        DiscussionThread.id == discussion_thread_id
-    )
-    results = await session.execute(statement)
-    discussion_thread = results.scalar()
+    discussion_thread = await session.get(DiscussionThread, discussion_thread_id)
     if discussion_thread is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Discussion thread not found"
         )
     return discussion_thread
 
+async def raise_not_found_or_unauthorized(
+    discussion_thread_id: int, session: AsyncSession
+):
+    # Only called after an ownership-filtered write matched no row
+    await get_discussion_thread(discussion_thread_id, session)
+    raise HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="This is not your discussion thread",
+    )
+
 
 @router.get("/")
 async def list_discussion_threads(
     search_title: Annotated[str | None, Query(max_length=20)] = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    cursor: int | None = None,
     session: AsyncSession = Depends(get_async_session)
 ):
-    if search_title is None:
-        statement = select(DiscussionThread, User) \
-            .where(DiscussionThread.user_id == User.id) \
-            .order_by(col(DiscussionThread.created_at).desc())
-    else:
-        statement = select(DiscussionThread, User) \
-            .where(DiscussionThread.user_id == User.id) \
-            .where(col(DiscussionThread.title).contains(search_title)) \
-            .order_by(col(DiscussionThread.created_at).desc())
+    cache_key = await list_cache_key(None, search_title, cursor, limit)
+    cached_page = await get_cached_list(cache_key)
+    if cached_page is not None:
+        return Response(content=cached_page, media_type="application/json")
+    statement = select_discussion_thread_summaries()
+    if search_title is not None:
+        statement = statement \
+            .where(col(DiscussionThread.title).contains(search_title))
+    statement = paginate_discussion_threads(statement, limit, cursor)
     results = await session.execute(statement)
-    return format_discussion_threads(results)
+    page = format_discussion_threads_page(results, limit)
+    await set_cached_list(cache_key, page)
+    return page
 
 
 @router.post("/create/")
@@ -150,6 +216,7 @@ async def create_discussion_thread(
         )
         session.add(new_discussion_thread)
         await session.commit()
+        await invalidate_cached_lists()
         return new_discussion_thread
     except Exception as e:
         raise HTTPException(
@@ -159,55 +226,88 @@ async def create_discussion_thread(
 
 @router.get("/{discussion_thread_id}/")
 async def read_discussion_thread(
+    request: Request,
+    response: Response,
     discussion_thread: DiscussionThread = Depends(get_discussion_thread),
 ):
+    headers = discussion_thread_cache_headers(discussion_thread)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
     return discussion_thread
 
 
+@router.get("/{discussion_thread_id}/image/")
+async def read_discussion_thread_image(
+    discussion_thread: DiscussionThread = Depends(get_discussion_thread),
+):
+    image_path = discussion_thread.image_path
+    if image_path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Discussion thread has no image"
+        )
+    if storage.is_object_key(image_path):
+        if storage.s3_client is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Image storage is unavailable"
+            )
+        return RedirectResponse(await storage.image_url(image_path))
+    return RedirectResponse(image_path)
+
+
 @router.patch("/{discussion_thread_id}/")
 async def update_discussion_thread(
+    discussion_thread_id: int,
     content: Annotated[str, Form()],
     current_user: Annotated[User, Depends(get_current_user)],
-    discussion_thread: DiscussionThread = Depends(get_discussion_thread),
     session: AsyncSession = Depends(get_async_session),
 ):
-    if discussion_thread.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="This is not your discussion thread",
-        )
+    statement = update(DiscussionThread) \
+        .where(col(DiscussionThread.id) == discussion_thread_id) \
+        .where(col(DiscussionThread.user_id) == current_user.id) \
+        .values(content=content, updated_at=datetime.now(UTC)) \
+        .returning(DiscussionThread)
     try:
-        discussion_thread.content = content
-        discussion_thread.updated_at = datetime.now(UTC)
-        session.add(discussion_thread)
+        results = await session.execute(statement)
+        discussion_thread = results.scalar()
         await session.commit()
-        return discussion_thread
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e)
         )
+    if discussion_thread is None:
+        await raise_not_found_or_unauthorized(discussion_thread_id, session)
+    await invalidate_cached_lists()
+    return discussion_thread
 
 
 @router.delete("/{discussion_thread_id}/")
 async def delete_discussion_thread(
+    discussion_thread_id: int,
     background_tasks: BackgroundTasks,
     current_user: Annotated[User, Depends(get_current_user)],
-    discussion_thread: DiscussionThread = Depends(get_discussion_thread),
     session: AsyncSession = Depends(get_async_session),
 ):
-    if discussion_thread.user_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="This is not your discussion thread",
-        )
+    statement = delete(DiscussionThread) \
+        .where(col(DiscussionThread.id) == discussion_thread_id) \
+        .where(col(DiscussionThread.user_id) == current_user.id) \
+        .returning(col(DiscussionThread.image_path))
     try:
-        await session.delete(discussion_thread)
+        results = await session.execute(statement)
+        deleted_row = results.first()
         await session.commit()
-        image_path = discussion_thread.image_path
-        if image_path:
-            background_tasks.add_task(remove_image, image_path)
-        return {"message": "Discussion thread deleted"}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_CONTENT, detail=str(e)
         )
+    if deleted_row is None:
+        await raise_not_found_or_unauthorized(discussion_thread_id, session)
+    await invalidate_cached_lists()
+    image_path = deleted_row.image_path
+    if image_path:
+        if storage.is_object_key(image_path):
+            background_tasks.add_task(storage.delete_image, image_path)
+        else:
+            background_tasks.add_task(remove_image, image_path)
+    return {"message": "Discussion thread deleted"}
@@ -0,0 +1,71 @@
+from app.config import get_settings
+
+import aioboto3
+from boto3.s3.transfer import TransferConfig
+from contextlib import AsyncExitStack
+from fastapi import UploadFile
+import logging
+
+config = get_settings()
+S3_BUCKET = config.get("S3_BUCKET")
+S3_ENDPOINT_URL = config.get("S3_ENDPOINT_URL") or None
+S3_URL_EXPIRES_IN = int(config.get("S3_URL_EXPIRES_IN") or 3600)
+S3_IMAGE_PREFIX = "images"
+MULTIPART_CHUNK_SIZE = 5 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+transfer_config = TransferConfig(
+    multipart_threshold=MULTIPART_CHUNK_SIZE,
+    multipart_chunksize=MULTIPART_CHUNK_SIZE,
+)
+s3_session = aioboto3.Session() if S3_BUCKET else None
+s3_client = None
+exit_stack = AsyncExitStack()
+
+
+async def open_storage():
+    global s3_client
+    if s3_session is not None:
+        s3_client = await exit_stack.enter_async_context(
+            s3_session.client("s3", endpoint_url=S3_ENDPOINT_URL)
+        )
+
+
+async def close_storage():
+    global s3_client
+    s3_client = None
+    await exit_stack.aclose()
+
+
+def is_object_key(image_path: str) -> bool:
+    # Local images are stored as URL paths under the static mount
+    return not image_path.startswith("/")
+
+
+async def upload_image(image: UploadFile, filename: str) -> str:
+    key = f"{S3_IMAGE_PREFIX}/{filename}"
+    await s3_client.upload_fileobj(
+        image,
+        S3_BUCKET,
+        key,
+        ExtraArgs={"ContentType": image.content_type or "application/octet-stream"},
+        Config=transfer_config,
+    )
+    return key
+
+
+async def delete_image(key: str):
+    # Rows can still hold object keys after S3 has been switched off
+    if s3_client is None:
+        logger.warning("Image storage is not configured; not deleting %s", key)
+        return
+    await s3_client.delete_object(Bucket=S3_BUCKET, Key=key)
+
+
+async def image_url(key: str) -> str:
+    return await s3_client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": S3_BUCKET, "Key": key},
+        ExpiresIn=S3_URL_EXPIRES_IN,
+    )
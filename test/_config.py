@@ -0,0 +1,24 @@
+from app.config import get_settings
+
+from functools import cache
+import os
+
+def database_url(database: str | None) -> str:
+    config = get_settings()
+    return "postgresql+asyncpg://{}:{}@{}:{}/{}".format(
+        config.get("DB_USER"),
+        config.get("DB_PASSWORD"),
+        config.get("DB_HOST"),
+        config.get("DB_PORT"),
+        database,
+    )
+
+@cache
+def test_db_name() -> str:
+    # Each pytest-xdist worker gets its own database
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "gw0")
+    return "{}_{}".format(get_settings().get("TEST_DB_NAME"), worker)
+
+@cache
+def test_db_url() -> str:
+    return database_url(test_db_name())
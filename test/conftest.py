@@ -1,83 +1,268 @@
-from app.auth import get_current_user
-from app.db import get_async_session
-from app.models import DiscussionThread, User
-from app.main import app
+from _config import test_db_name, test_db_url
+from app.config import get_settings
 
 import asyncpg
-from dotenv import dotenv_values
+from contextlib import AsyncExitStack
+from fastapi import Request
+from fastapi.dependencies.utils import get_dependant, get_flat_dependant, solve_dependencies
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from functools import cache
+import hashlib
+import logging
 from httpx import ASGITransport, AsyncClient
-from passlib.hash import pbkdf2_sha256
+import pytest
 import pytest_asyncio
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
-from sqlalchemy.pool import NullPool
+from sqlalchemy.schema import CreateIndex, CreateTable
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.datastructures import FormData
+from urllib.parse import urlencode
 
-config = dotenv_values(".env")
-TEST_DATABASE_URL = "postgresql+asyncpg://{}:{}@{}:{}/{}".format(
-    config.get("DB_USER"),
-    config.get("DB_PASSWORD"),
-    config.get("DB_HOST"),
-    config.get("DB_PORT"),
-    config.get("TEST_DB_NAME"),
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+config = get_settings()
+TEMPLATE_DB_NAME = "{}_template".format(config.get("TEST_DB_NAME"))
+# get_current_user is overridden once per session to return whatever user the
+# current test has put here
+_current_user_ref = {"user": None}
+# Serializes template checks and rebuilds between pytest-xdist workers
+TEMPLATE_LOCK_ID = 0x7465_7374
+# Keep SQL logging off even when SQL_ECHO is set in the developer's .env
+logging.getLogger("sqlalchemy").setLevel(logging.WARNING)
+
+# commit() in fixtures and routes only releases a SAVEPOINT, so each test's
+# writes are discarded when its outer transaction is rolled back
+test_session = async_sessionmaker(
+    class_=AsyncSession,
+    expire_on_commit=False,
+    join_transaction_mode="create_savepoint",
 )
-test_engine = create_async_engine(TEST_DATABASE_URL, echo=False, poolclass=NullPool)
-test_session = async_sessionmaker(test_engine, class_=AsyncSession, expire_on_commit=False)
 
-@pytest_asyncio.fixture(scope="session", autouse=True)
-async def setup_test_database():
-    conn = await asyncpg.connect(
+# The session-wide loop runs on uvloop when it is available (not on Windows)
+if uvloop is not None:
+    def pytest_asyncio_loop_factories():
+        return {"uvloop": uvloop.new_event_loop}
+
+# The app, its routers and models are only imported once a test actually runs,
+# so collection-only runs skip that cost
+@pytest.fixture(scope="session")
+def test_app():
+    from app import cache
+    from app.main import app
+    # Cached listing pages would outlive the per-test schema, so never use Redis here
+    cache.redis_client = None
+    return app
+
+# Rendered once from the models and run as a single batch against the empty
+# template, so there is no per-table checkfirst introspection
+@cache
+def schema_ddl() -> str:
+    dialect = postgresql.dialect()
+    ddl = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+    for table in SQLModel.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)).strip())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            ddl.append(str(CreateIndex(index).compile(dialect=dialect)))
+    return ";\n".join(ddl) + ";"
+
+def schema_fingerprint() -> str:
+    return hashlib.sha256(schema_ddl().encode()).hexdigest()
+
+async def connect_database(database: str | None) -> asyncpg.Connection:
+    return await asyncpg.connect(
         user=config.get("DB_USER"),
         password=config.get("DB_PASSWORD"),
         host=config.get("DB_HOST"),
         port=config.get("DB_PORT"),
-        database=config.get("DB_NAME"),
+        database=database,
     )
-    await conn.execute(f'DROP DATABASE IF EXISTS "{config.get("TEST_DB_NAME")}" WITH (FORCE)')
-    await conn.execute(f'CREATE DATABASE "{config.get("TEST_DB_NAME")}"')
+
+async def create_template_database(conn: asyncpg.Connection, fingerprint: str):
+    await conn.execute(f'CREATE DATABASE "{TEMPLATE_DB_NAME}"')
+    template_conn = await connect_database(TEMPLATE_DB_NAME)
+    async with template_conn.transaction():
+        await template_conn.execute(schema_ddl())
+    await template_conn.close()
+    await conn.execute(f'ALTER DATABASE "{TEMPLATE_DB_NAME}" IS_TEMPLATE true')
+    await conn.execute(f"COMMENT ON DATABASE \"{TEMPLATE_DB_NAME}\" IS '{fingerprint}'")
+
+async def drop_template_database(conn: asyncpg.Connection):
+    await conn.execute(f'ALTER DATABASE "{TEMPLATE_DB_NAME}" IS_TEMPLATE false')
+    await conn.execute(f'DROP DATABASE "{TEMPLATE_DB_NAME}" WITH (FORCE)')
+
+@pytest_asyncio.fixture(scope="session", autouse=True)
+async def setup_test_database(test_app):
+    conn = await connect_database(config.get("DB_NAME"))
+    # The template keeps the schema between runs and is only rebuilt when the
+    # models change, so a run just clones it instead of running create_all
+    fingerprint = schema_fingerprint()
+    test_db = test_db_name()
+    await conn.execute("SELECT pg_advisory_lock($1)", TEMPLATE_LOCK_ID)
+    try:
+        template = await conn.fetchrow(
+            "SELECT shobj_description(oid, 'pg_database') AS fingerprint "
+            "FROM pg_database WHERE datname = $1",
+            TEMPLATE_DB_NAME,
+        )
+        if template is not None and template["fingerprint"] != fingerprint:
+            await drop_template_database(conn)
+            template = None
+        if template is None:
+            await create_template_database(conn, fingerprint)
+        await conn.execute(f'DROP DATABASE IF EXISTS "{test_db}" WITH (FORCE)')
+        await conn.execute(f'CREATE DATABASE "{test_db}" TEMPLATE "{TEMPLATE_DB_NAME}"')
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", TEMPLATE_LOCK_ID)
     yield
-    await conn.execute(f'DROP DATABASE IF EXISTS "{config.get("TEST_DB_NAME")}" WITH (FORCE)')
+    await conn.execute(f'DROP DATABASE IF EXISTS "{test_db}" WITH (FORCE)')
     await conn.close()
 
-@pytest_asyncio.fixture(scope="function")
-async def get_test_engine():
-    async with test_engine.begin() as conn:
-        await conn.run_sync(SQLModel.metadata.create_all)
+@pytest_asyncio.fixture(scope="session")
+async def get_test_engine(setup_test_database):
+    # Built here rather than at import so each xdist worker uses its own database
+    test_engine = create_async_engine(
+        test_db_url(),
+        echo=False,
+        pool_size=10,
+        max_overflow=0,
+        query_cache_size=2048,
+        connect_args={
+            "statement_cache_size": 1024,
+            "prepared_statement_cache_size": 1024,
+        },
+    )
     yield test_engine
-    async with test_engine.begin() as conn:
-        await conn.run_sync(SQLModel.metadata.drop_all)
+    await test_engine.dispose()
 
 @pytest_asyncio.fixture(scope="function")
 async def get_test_session(get_test_engine):
-    async with test_session() as session:
-        yield session
+    async with get_test_engine.connect() as conn:
+        transaction = await conn.begin()
+        async with test_session(bind=conn) as session:
+            yield session
+        await transaction.rollback()
+
+@pytest_asyncio.fixture(scope="session")
+async def async_client(test_app):
+    async with AsyncClient(transport=ASGITransport(app=test_app), base_url="http://localhost") as client:
+        yield client
 
 @pytest_asyncio.fixture(scope="function", autouse=True)
-async def async_client(get_test_session):
-    def override_get_async_session():
+async def override_async_session(test_app, get_test_session):
+    from app.db import get_async_session
+    async def override_get_async_session():
         yield get_test_session
-    app.dependency_overrides[get_async_session] = override_get_async_session
-    return AsyncClient(transport=ASGITransport(app=app), base_url="http://localhost")
+    test_app.dependency_overrides[get_async_session] = override_get_async_session
+    yield
+    test_app.dependency_overrides.pop(get_async_session, None)
 
-@pytest_asyncio.fixture(scope="function", autouse=True)
-async def get_test_user(get_test_session: AsyncSession):
-    test_user = User(username="testuser", hashed_password=pbkdf2_sha256.hash("testuserpw"))
-    get_test_session.add(test_user)
-    await get_test_session.commit()
+# Calls a route handler without the ASGI stack. Keyword arguments are routed by
+# name (or alias) to the handler's path, query, header or cookie parameters,
+# and anything else is sent as form data; FastAPI's own dependency solver then
+# validates them and applies the app's dependency overrides.
+@pytest_asyncio.fixture(scope="function")
+async def call_endpoint(test_app, override_async_session, get_test_user):
+    async def call(method: str, path: str, **values):
+        route = next(
+            route for route in test_app.router.routes
+            if isinstance(route, APIRoute)
+            and route.path == path
+            and method.upper() in route.methods
+        )
+        dependant = get_dependant(path=route.path_format, call=route.endpoint)
+        flat_dependant = get_flat_dependant(dependant)
+        sources = {
+            "path": {field.alias for field in flat_dependant.path_params},
+            "query": {field.alias for field in flat_dependant.query_params},
+            "header": {field.alias for field in flat_dependant.header_params},
+            "cookie": {field.alias for field in flat_dependant.cookie_params},
+        }
+        params = {source: {} for source in sources}
+        form = []
+        for name, value in values.items():
+            source = next((source for source, names in sources.items() if name in names), None)
+            if source is None:
+                form.append((name, value))
+            else:
+                params[source][name] = str(value)
+        headers = [*params["header"].items()]
+        if params["cookie"]:
+            headers.append(("cookie", "; ".join(f"{name}={value}" for name, value in params["cookie"].items())))
+        async with AsyncExitStack() as request_stack:
+            async with AsyncExitStack() as function_stack:
+                request = Request({
+                    "type": "http",
+                    "method": method.upper(),
+                    "path": path,
+                    "path_params": params["path"],
+                    "query_string": urlencode(params["query"]).encode(),
+                    "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+                    "app": test_app,
+                    # The exit stacks FastAPI's request handler puts in the scope
+                    "fastapi_inner_astack": request_stack,
+                    "fastapi_function_astack": function_stack,
+                })
+                solved = await solve_dependencies(
+                    request=request,
+                    dependant=dependant,
+                    body=FormData(form) if form else None,
+                    dependency_overrides_provider=test_app,
+                    async_exit_stack=request_stack,
+                    # Computed by APIRoute the same way for real requests
+                    embed_body_fields=route._embed_body_fields,
+                )
+                if solved.errors:
+                    raise RequestValidationError(solved.errors)
+                result = await route.endpoint(**solved.values)
+            if solved.background_tasks is not None:
+                await solved.background_tasks()
+        return result
+    return call
+
+# Users are inserted once outside the per-test transactions, so every test
+# sees them while its own writes are still rolled back
+@pytest_asyncio.fixture(scope="session")
+async def seed_users(get_test_engine):
+    from app.models import User
+    from passlib.hash import pbkdf2_sha256
+    # Hashed with few rounds; tests do not need a slow KDF
+    password_hasher = pbkdf2_sha256.using(rounds=1000)
+    test_user = User(username="testuser", hashed_password=password_hasher.hash("testuserpw"))
+    another_test_user = User(username="testuser2", hashed_password=password_hasher.hash("testuser2pw"))
+    async with test_session(bind=get_test_engine) as session:
+        session.add_all([test_user, another_test_user])
+        await session.commit()
+    return test_user, another_test_user
+
+@pytest.fixture(scope="session", autouse=True)
+def override_current_user(test_app):
+    from app.auth import get_current_user
     def override_get_current_user():
-        return test_user
-    app.dependency_overrides[get_current_user] = override_get_current_user
+        return _current_user_ref["user"]
+    test_app.dependency_overrides[get_current_user] = override_get_current_user
+    yield
+    test_app.dependency_overrides.pop(get_current_user, None)
+
+@pytest_asyncio.fixture(scope="function", autouse=True)
+async def get_test_user(seed_users):
+    test_user = seed_users[0]
+    _current_user_ref["user"] = test_user
     yield test_user
+    _current_user_ref["user"] = None
 
 @pytest_asyncio.fixture(scope="function", autouse=True)
-async def another_test_user(get_test_session: AsyncSession):
-    another_test_user = User(username="testuser2", hashed_password=pbkdf2_sha256.hash("testuser2pw"))
-    get_test_session.add(another_test_user)
-    await get_test_session.commit()
-    yield another_test_user
+async def another_test_user(seed_users):
+    yield seed_users[1]
 
 @pytest_asyncio.fixture(scope="function", autouse=True)
 async def mock_discussion_thread(get_test_session: AsyncSession, get_test_user):
+    from app.models import DiscussionThread
     mock_discussion_thread = DiscussionThread(user_id=get_test_user.id, title="testtitle1", content="testcontent1")
     get_test_session.add(mock_discussion_thread)
     await get_test_session.commit()
@@ -85,6 +270,7 @@ async def mock_discussion_thread(get_test_session: AsyncSession, get_test_user):
 
 @pytest_asyncio.fixture(scope="function", autouse=True)
 async def another_mock_discussion_threads(get_test_session: AsyncSession, another_test_user):
+    from app.models import DiscussionThread
     another_mock_discussion_threads = DiscussionThread(user_id=another_test_user.id, title="testtitle2", content="testcontent2")
     get_test_session.add(another_mock_discussion_threads)
     await get_test_session.commit()
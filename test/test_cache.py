@@ -0,0 +1,82 @@
+import pytest
+
+# app.cache pulls in redis and FastAPI, so it is only imported by the tests
+# that run, not at collection time
+def redis_down():
+    from redis.exceptions import ConnectionError
+    return ConnectionError("redis is down")
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value.decode() if isinstance(value, bytes) else value
+
+    async def incr(self, key):
+        self.store[key] = str(int(self.store.get(key, 0)) + 1)
+        return int(self.store[key])
+
+class BrokenRedis:
+    async def get(self, key):
+        raise redis_down()
+
+    async def set(self, key, value, ex=None):
+        raise redis_down()
+
+    async def incr(self, key):
+        raise redis_down()
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    fake_redis = FakeRedis()
+    monkeypatch.setattr("app.cache.redis_client", fake_redis)
+    return fake_redis
+
+@pytest.mark.asyncio
+async def test_list_cache_key_cursor(fake_redis):
+    from app import cache
+    first_page_key = await cache.list_cache_key(None, None, None, 50)
+    assert first_page_key != await cache.list_cache_key(None, None, 0, 50)
+
+@pytest.mark.asyncio
+async def test_list_threads_cache_hit(async_client, fake_redis, get_test_session, get_test_user):
+    from app.models import DiscussionThread
+    response = await async_client.get("/discussion_threads/")
+    assert len(response.json().get("items")) == 2
+    # Written behind the cache's back, so a hit still returns the old page
+    get_test_session.add(DiscussionThread(user_id=get_test_user.id, title="uncached", content="uncached"))
+    await get_test_session.commit()
+    response = await async_client.get("/discussion_threads/")
+    assert response.status_code == 200
+    assert len(response.json().get("items")) == 2
+
+@pytest.mark.asyncio
+async def test_list_threads_cache_invalidation(async_client, fake_redis, mock_discussion_thread):
+    async def list_length():
+        response = await async_client.get("/discussion_threads/")
+        return len(response.json().get("items"))
+    assert await list_length() == 2
+    response = await async_client.post("/discussion_threads/create/", data={"title": "cached", "content": "cached"})
+    assert response.status_code == 200
+    assert await list_length() == 3
+    from app.cache import LIST_CACHE_VERSION_KEY
+    version = fake_redis.store[LIST_CACHE_VERSION_KEY]
+    response = await async_client.patch(f"/discussion_threads/{mock_discussion_thread.id}/", data={"content": "updated"})
+    assert response.status_code == 200
+    assert fake_redis.store[LIST_CACHE_VERSION_KEY] != version
+    response = await async_client.delete(f"/discussion_threads/{mock_discussion_thread.id}/")
+    assert response.status_code == 200
+    assert await list_length() == 2
+
+@pytest.mark.asyncio
+async def test_list_threads_redis_error(async_client, monkeypatch):
+    monkeypatch.setattr("app.cache.redis_client", BrokenRedis())
+    response = await async_client.get("/discussion_threads/")
+    assert response.status_code == 200
+    assert len(response.json().get("items")) == 2
+    response = await async_client.post("/discussion_threads/create/", data={"title": "uncached", "content": "uncached"})
+    assert response.status_code == 200
@@ -1,10 +1,39 @@
+from fastapi.exceptions import RequestValidationError
 import pytest
 
 @pytest.mark.asyncio
 async def test_list_threads(async_client):
     response = await async_client.get("/discussion_threads/")
     assert response.status_code == 200
-    assert len(response.json()) == 2
+    assert len(response.json().get("items")) == 2
+    assert "content" not in response.json().get("items")[0]
+
+@pytest.mark.asyncio
+async def test_list_threads_direct(call_endpoint, mock_discussion_thread):
+    page = await call_endpoint("GET", "/discussion_threads/", search_title="testtitle1")
+    assert [item.get("id") for item in page.get("items")] == [mock_discussion_thread.id]
+    assert page.get("nextCursor") is None
+
+@pytest.mark.asyncio
+async def test_list_threads_direct_invalid_limit(call_endpoint):
+    with pytest.raises(RequestValidationError):
+        await call_endpoint("GET", "/discussion_threads/", limit=0)
+
+@pytest.mark.asyncio
+async def test_get_thread_direct(call_endpoint, mock_discussion_thread):
+    discussion_thread = await call_endpoint("GET", "/discussion_threads/{discussion_thread_id}/", discussion_thread_id=mock_discussion_thread.id)
+    assert discussion_thread.id == mock_discussion_thread.id
+
+@pytest.mark.asyncio
+async def test_list_threads_pagination(async_client, mock_discussion_thread, another_mock_discussion_threads):
+    ids = sorted([mock_discussion_thread.id, another_mock_discussion_threads.id], reverse=True)
+    response = await async_client.get("/discussion_threads/", params={"limit": 1})
+    assert response.status_code == 200
+    assert [item.get("id") for item in response.json().get("items")] == ids[:1]
+    next_cursor = response.json().get("nextCursor")
+    response = await async_client.get("/discussion_threads/", params={"limit": 1, "cursor": next_cursor})
+    assert response.status_code == 200
+    assert [item.get("id") for item in response.json().get("items")] == ids[1:]
 
 @pytest.mark.asyncio
 async def test_create_thread(async_client):
@@ -20,6 +49,23 @@ async def test_get_thread(async_client, mock_discussion_thread):
     assert response.status_code == 200
     assert response.json().get("id") == mock_discussion_thread.id
 
+@pytest.mark.asyncio
+async def test_get_thread_not_modified(async_client, mock_discussion_thread):
+    response = await async_client.get(f"/discussion_threads/{mock_discussion_thread.id}/")
+    etag = response.headers.get("etag")
+    assert etag is not None
+    response = await async_client.get(f"/discussion_threads/{mock_discussion_thread.id}/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers.get("etag") == etag
+    response = await async_client.get(f"/discussion_threads/{mock_discussion_thread.id}/", headers={"If-None-Match": etag.removeprefix("W/")})
+    assert response.status_code == 304
+
+@pytest.mark.asyncio
+async def test_get_thread_image_without_image(async_client, mock_discussion_thread):
+    response = await async_client.get(f"/discussion_threads/{mock_discussion_thread.id}/image/")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Discussion thread has no image"}
+
 @pytest.mark.asyncio
 async def test_update_thread(async_client, mock_discussion_thread):
     data = {"content": "updatedcontent"}
@@ -40,6 +86,12 @@ async def test_delete_thread(async_client, mock_discussion_thread):
     assert response.status_code == 200
     assert response.json() == {"message": "Discussion thread deleted"}
 
+@pytest.mark.asyncio
+async def test_delete_thread_not_found(async_client):
+    response = await async_client.delete("/discussion_threads/0/")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Discussion thread not found"}
+
 @pytest.mark.asyncio
 async def test_delete_thread_unauthorized(async_client, another_mock_discussion_threads):
     response = await async_client.delete(f"/discussion_threads/{another_mock_discussion_threads.id}/")
@@ -50,4 +102,4 @@ async def test_delete_thread_unauthorized(async_client, another_mock_discussion_
 async def test_my_discussion_threads(async_client):
     response = await async_client.get("/user/discussion_threads/")
     assert response.status_code == 200
-    assert len(response.json()) == 1
+    assert len(response.json().get("items")) == 1
@@ -0,0 +1,49 @@
+import pytest
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+
+    async def upload_fileobj(self, fileobj, bucket, key, ExtraArgs=None, Config=None):
+        self.objects[key] = await fileobj.read()
+
+    async def generate_presigned_url(self, operation, Params=None, ExpiresIn=None):
+        return f"https://s3.example.com/{Params['Key']}?expires={ExpiresIn}"
+
+    async def delete_object(self, Bucket=None, Key=None):
+        self.objects.pop(Key, None)
+
+@pytest.fixture
+def fake_s3_client(monkeypatch):
+    fake_s3_client = FakeS3Client()
+    monkeypatch.setattr("app.storage.s3_client", fake_s3_client)
+    return fake_s3_client
+
+async def create_thread_with_image(async_client) -> dict:
+    files = {"image": ("photo.png", b"png-bytes", "image/png")}
+    response = await async_client.post("/discussion_threads/create/", data={"title": "photo", "content": "photo"}, files=files)
+    assert response.status_code == 200
+    return response.json()
+
+@pytest.mark.asyncio
+async def test_image_upload_presign_and_delete(async_client, fake_s3_client):
+    discussion_thread = await create_thread_with_image(async_client)
+    image_key = discussion_thread.get("image_path")
+    assert not image_key.startswith("/")
+    assert fake_s3_client.objects == {image_key: b"png-bytes"}
+    response = await async_client.get(f"/discussion_threads/{discussion_thread.get('id')}/image/")
+    assert response.status_code == 307
+    assert response.headers.get("location").startswith(f"https://s3.example.com/{image_key}")
+    response = await async_client.delete(f"/discussion_threads/{discussion_thread.get('id')}/")
+    assert response.status_code == 200
+    assert fake_s3_client.objects == {}
+
+@pytest.mark.asyncio
+async def test_image_without_storage(async_client, fake_s3_client, monkeypatch):
+    discussion_thread = await create_thread_with_image(async_client)
+    monkeypatch.setattr("app.storage.s3_client", None)
+    response = await async_client.get(f"/discussion_threads/{discussion_thread.get('id')}/image/")
+    assert response.status_code == 503
+    assert response.json() == {"detail": "Image storage is unavailable"}
+    response = await async_client.delete(f"/discussion_threads/{discussion_thread.get('id')}/")
+    assert response.status_code == 200
@@ -27,6 +27,15 @@ async def test_create_user_duplicate_username(async_client):
     response = await async_client.post("/user/create/", data=data)
     assert response.status_code == 422
 
+@pytest.mark.asyncio
+async def test_login_for_access_token_new_user(async_client):
+    data = new_user_data()
+    await async_client.post("/user/create/", data=data)
+    del data["confirm_password"]
+    response = await async_client.post("/token/", data=data)
+    assert response.status_code == 200
+    assert response.json().get("access_token") is not None
+
 @pytest.mark.asyncio
 async def test_login_for_access_token(async_client):
     data = user_data()